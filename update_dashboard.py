@@ -1,50 +1,151 @@
-import requests, datetime, time, csv, os, sys
+import requests, datetime, time, csv, json, os, sys, argparse, threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-URL = "https://query1.finance.yahoo.com/v8/finance/chart/{}"
+try:
+    import orjson
+    _loads, _dumps = orjson.loads, orjson.dumps
+except ImportError:  # stdlib fallback; json.loads also accepts bytes
+    _loads = json.loads
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
+URL = "https://query1.finance.yahoo.com/v8/finance/spark"
+BATCH = 20  # spark accepts up to ~20 symbols per call
+CACHE_TTL = 3600  # seconds a cached chart is considered fresh
 TICKERS = ["SPY","QQQ","XLK","XLF","IWF","IWD","TLT","GLD"]
+LOOKBACKS = np.array([63, 126])  # trading days for Ret3M, Ret6M
+MIN_BARS = int(LOOKBACKS.max()) + 4  # bars required before returns are reported
+
+# smallest Yahoo range holding enough daily bars for the longest lookback
+RANGES = {21: "2mo", 63: "6mo", 126: "1y", 252: "2y"}
+RANGE = next(r for n, r in sorted(RANGES.items()) if n >= LOOKBACKS.max())
+INTERVAL = "1d"
+
+# one keep-alive pool for every request to Yahoo; retries cover 429s
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504])
+))
+_SESSION.headers.update({"User-Agent": "Mozilla/5.0", "Accept": "application/json"})
+
+class RateLimiter:
+    # spaces real HTTP requests at least min_interval apart; cache hits never wait
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+_RATE = RateLimiter(0.2)
+
+def _cache_path(cache_dir, t):
+    return os.path.join(cache_dir, f"{t}_{RANGE}_{INTERVAL}.json")
+
+def read_cache(cache_dir, t, ttl=CACHE_TTL):
+    # unreadable or malformed entries are treated as misses and refetched
+    try:
+        with open(_cache_path(cache_dir, t), "rb") as f:
+            entry = _loads(f.read())
+        # the stricter of the stored and requested TTL wins, so --ttl 0 always refetches
+        if time.time() - entry["cached_at"] >= min(entry["ttl"], ttl):
+            return None
+        payload = entry["payload"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return payload if isinstance(payload, dict) else None
 
-def fetch(t):
-    r = requests.get(
-        URL.format(t),
-        params={"range": "1y", "interval": "1d"},
-        headers={"User-Agent": "Mozilla/5.0"},
-        timeout=20
-    )
-    r.raise_for_status()
-    j = r.json()
-    closes = j["chart"]["result"][0]["indicators"]["quote"][0]["close"]
-    closes = [x for x in closes if x is not None]
-    if len(closes) < 130:
-        return None, None, None
-    last = closes[-1]
-    r3 = last / closes[-63] - 1
-    r6 = last / closes[-126] - 1
-    return last, r3, r6
-
-def main(out_dir):
-    spy_last, spy_r3, spy_r6 = fetch("SPY")
-    if spy_last is None:
+def write_cache(cache_dir, t, payload, ttl):
+    path = _cache_path(cache_dir, t)
+    with open(path + ".tmp", "wb") as f:
+        f.write(_dumps({"cached_at": time.time(), "ttl": ttl, "payload": payload}))
+    os.replace(path + ".tmp", path)
+
+def fetch_batch(tickers, cache_dir, ttl=CACHE_TTL):
+    data = {t: read_cache(cache_dir, t, ttl) for t in tickers}
+    missing = [t for t, d in data.items() if d is None]
+    if missing:
+        _RATE.acquire()
+        r = _SESSION.get(
+            URL,
+            params={"symbols": ",".join(missing), "range": RANGE, "interval": INTERVAL},
+            timeout=20
+        )
+        r.raise_for_status()
+        j = _loads(r.content)
+        for t in missing:
+            data[t] = j.get(t) or {}
+            if data[t].get("close"):
+                write_cache(cache_dir, t, data[t], ttl)
+    return {t: closes_array(d.get("close") or []) for t, d in data.items()}
+
+def closes_array(closes):
+    return np.asarray([x for x in closes if x is not None], dtype=np.float64)
+
+def compute_returns(closes, order):
+    # one (N, 1 + len(LOOKBACKS)) price matrix: latest close, then each lookback;
+    # tickers with too little history stay NaN
+    idx = np.concatenate(([1], LOOKBACKS))
+    M = np.full((len(order), idx.size), np.nan)
+    for i, t in enumerate(order):
+        if closes[t].size >= MIN_BARS:
+            M[i] = closes[t][-idx]
+    return M[:, 0], M[:, :1] / M[:, 1:] - 1.0
+
+def main(out_dir, ttl=CACHE_TTL):
+    cache_dir = os.path.join(out_dir, ".yahoo_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # one spark request per BATCH symbols (SPY included once), run concurrently
+    symbols = list(dict.fromkeys(["SPY"] + TICKERS))
+    chunks = [symbols[i:i + BATCH] for i in range(0, len(symbols), BATCH)]
+    closes = {}
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        for batch in ex.map(lambda c: fetch_batch(c, cache_dir, ttl), chunks):
+            closes.update(batch)
+
+    last, rets = compute_returns(closes, symbols)
+    spy = symbols.index("SPY")
+    if np.isnan(last[spy]):
         raise RuntimeError("SPY data unavailable")
+    rs = rets - rets[spy]
 
     now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     out_csv = os.path.join(out_dir, "dashboard_data.csv")
     tmp_csv = out_csv + ".tmp"
 
+    rows = [["Ticker","Last","Ret3M","Ret6M","RS6M","UpdatedAt"]]
+    for t in TICKERS:
+        i = symbols.index(t)
+        if np.isnan(last[i]):
+            rows.append([t,"","","","",now])
+        else:
+            r3, r6 = rets[i].tolist()
+            rows.append([t,last[i].item(),r3,r6,rs[i, 1].item(),now])
+
     with open(tmp_csv, "w", newline="") as f:
-        w = csv.writer(f)
-        w.writerow(["Ticker","Last","Ret3M","Ret6M","RS6M","UpdatedAt"])
-        for t in TICKERS:
-            last, r3, r6 = fetch(t)
-            if last is None:
-                w.writerow([t,"","","","",now])
-            else:
-                w.writerow([t,last,r3,r6,(r6 - spy_r6),now])
-            time.sleep(0.2)
+        csv.writer(f).writerows(rows)
 
     os.replace(tmp_csv, out_csv)  # atomic swap
     print(f"Wrote {out_csv} at {now}")
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ttl", type=int, default=CACHE_TTL,
+                    help="seconds before cached Yahoo data is refetched")
+    args = ap.parse_args()
     # write CSV to the script's folder
     out_dir = os.path.dirname(os.path.abspath(__file__))
-    main(out_dir)
+    main(out_dir, args.ttl)